@@ -1,42 +1,93 @@
+import os
+import tempfile
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 
-def load_data(file_path, target_col='OT', scale=True):
+# 缓存格式版本：列选择或标准化逻辑改变时递增，使旧缓存自动失效
+_CACHE_VERSION = 'v2'
+
+def _read_column_chunks(file_path, col, chunksize):
+    """逐块读取单列，每次只产出一个 float32 数组块"""
+    reader = pd.read_csv(file_path, usecols=[col], dtype={col: np.float32}, chunksize=chunksize)
+    for chunk in reader:
+        yield chunk[col].to_numpy(dtype=np.float32, copy=False)
+
+def load_data(file_path, target_col='OT', scale=True, chunksize=1_000_000):
     """
     加载并预处理数据
     :param file_path: csv 文件路径
     :param target_col: 主要分析的目标列 (如 OT)，如果是 None 则分析所有列的平均值
+    :param chunksize: 分块读取的行数，大文件 (Traffic/Electricity) 不必一次载入内存
     :return: 处理后的 numpy 数组
     """
+    # 处理结果缓存为 .npy，CSV 未更新时重复运行直接内存映射读取，跳过解析
+    cache_path = file_path + f".{target_col}.{'z' if scale else 'raw'}.{_CACHE_VERSION}.f32.npy"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+        try:
+            return np.load(cache_path, mmap_mode='r')
+        except (OSError, ValueError, EOFError) as e:
+            # 缓存损坏 (如写入中途被中断)，回退为重新解析 CSV
+            print(f"Warning: ignoring unreadable cache {cache_path}: {e}")
+
+    # 策略：如果是多变量，我们计算“全局主导周期”
+    # 方法是：计算每一列的小波谱，然后取平均？
+    # 或者简单起见，这里只取目标列 OT 做演示。
+    # 如果想更严谨，可以取 data[:, -1] (OT列) 或者 np.mean(data, axis=1)
+    # 先选出目标列再标准化，其余列 (包括 date) 根本不读入
     try:
-        df = pd.read_csv(file_path)
+        # 只读表头确定要用的列，再只解析这一列 (Electricity 有 300 多列)
+        columns = pd.read_csv(file_path, nrows=0).columns
+        if target_col and target_col in columns:
+            col = target_col
+        else:
+            # 如果没有指定列，或者找不到列，取最后一个数值列作为代表
+            # 先读少量行判断类型，避免选到 date 等字符串列
+            head = pd.read_csv(file_path, nrows=100)
+            col = head.select_dtypes(include=[np.number]).columns[-1]
+
+        if not scale:
+            series = np.concatenate(list(_read_column_chunks(file_path, col, chunksize)))
+        else:
+            # 第一遍：按块合并 Welford 统计量 (n, mean, M2)，用 float64 累积
+            n, mean, m2 = 0, 0.0, 0.0
+            for vals in _read_column_chunks(file_path, col, chunksize):
+                n_b = len(vals)
+                if n_b == 0:
+                    continue
+                vals = vals.astype(np.float64)
+                mean_b = vals.mean()
+                m2_b = ((vals - mean_b) ** 2).sum()
+                delta = mean_b - mean
+                total = n + n_b
+                mean += delta * n_b / total
+                m2 += m2_b + delta ** 2 * n * n_b / total
+                n = total
+
+            # 标准化 (Z-Score)，与 StandardScaler 一致：总体标准差，常数列只做去均值
+            std = np.sqrt(m2 / n) if n > 0 else 0.0
+            std = std if std > 0 else 1.0
+
+            # 第二遍：标准化后直接写入预分配的 float32 缓冲区
+            series = np.empty(n, dtype=np.float32)
+            i = 0
+            for vals in _read_column_chunks(file_path, col, chunksize):
+                series[i:i + len(vals)] = (vals - mean) / std
+                i += len(vals)
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return None
 
-    # 剔除非数值列 (通常是 date)
-    cols_to_drop = ['date']
-    if 'date' in df.columns:
-        df = df.drop(columns=['date'])
-    
-    data = df.values
-
-    # 标准化 (Z-Score)
-    if scale:
-        scaler = StandardScaler()
-        data = scaler.fit_transform(data)
+    series = series.astype(np.float32, copy=False)
+    # 先写同目录下的临时文件再原子替换，中断时不会留下半截缓存
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(cache_path) or '.')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, series)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: cannot write cache {cache_path}: {e}")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-    # 策略：如果是多变量，我们计算“全局主导周期”
-    # 方法是：计算每一列的小波谱，然后取平均？
-    # 或者简单起见，这里只取目标列 OT 做演示。
-    # 如果想更严谨，可以取 data[:, -1] (OT列) 或者 np.mean(data, axis=1)
-    
-    if target_col and target_col in df.columns:
-        target_idx = df.columns.get_loc(target_col)
-        series = data[:, target_idx]
-    else:
-        # 如果没有指定列，或者找不到列，取最后一列作为代表
-        series = data[:, -1]
-        
-    return series
\ No newline at end of file
+    return series
@@ -1,9 +1,70 @@
 import os
+import argparse
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # 子进程里没有显示界面，只保存图片
 from modwt import MODWTPeriodExtractor
 from data_loader import load_data
 
-def main():
+# 每个子进程各自持有一个提取器，由 _worker_init 创建，该进程处理的所有数据集共用
+EXTRACTOR = None
+
+def _worker_init(extractor_state):
+    """
+    子进程初始化：只构造一次提取器，小波滤波器、滤波器频谱缓存和画布在该进程的任务间复用
+    :param extractor_state: 构造 MODWTPeriodExtractor 的参数
+    """
+    global EXTRACTOR
+    EXTRACTOR = MODWTPeriodExtractor(**extractor_state)
+    # 子进程退出时释放复用的画布；fork 启动的子进程不会执行 atexit，
+    # 而 multiprocessing 的 Finalize (设置 exitpriority 后) 在 fork/spawn 下都会执行
+    multiprocessing.util.Finalize(None, EXTRACTOR.close, exitpriority=10)
+
+# 两种提取模式：constrained 按 max_p 屏蔽超过 Look-back Window 的周期；unconstrained 保留全部层
+MODES = ('constrained', 'unconstrained')
+
+def _process(ds_name, config, modes, dataset_dir, output_dir):
+    """
+    单个数据集的完整流程 (加载 -> 提取 -> 绘图)，在子进程中运行
+    同一份序列只加载一次，依次跑 modes 里的每种提取模式
+    :return: (数据集名称, {模式: Top-k 周期})，加载失败时为 None
+    """
+    file_path = os.path.join(dataset_dir, ds_name)
+    print(f"\nProcessing {ds_name}...")
+    
+    # 1. 加载数据
+    series = load_data(file_path, scale=True)
+    if series is None:
+        return ds_name, None
+        
+    extractor = EXTRACTOR
+    periods_by_mode = {}
+    for mode in modes:
+        # 2. 提取周期 (constrained 模式传入约束参数)
+        max_p = config['max_p'] if mode == 'constrained' else None
+        results = extractor.extract(series, input_name=ds_name, max_allowed_period=max_p)
+        
+        # 3. 获取结果
+        periods_by_mode[mode] = [p for p, e in results['top_k']]
+        
+        # 4. 兜底策略：如果提取出来的全是 2, 4 这种极小噪声
+        # 或者不足 3 个，我们可以手动补全一些更有意义的
+        # 但通常经过上述修改，应该能提取到 16, 32, 64 等中频信号
+        
+        # 绘图
+        suffix = '_spectrum.png' if mode == 'constrained' else '_spectrum_unconstrained.png'
+        plot_name = ds_name.replace('.csv', suffix)
+        extractor.plot_spectrum(results, save_path=os.path.join(output_dir, plot_name))
+    
+    return ds_name, periods_by_mode
+
+def main(mode='constrained'):
+    """
+    :param mode: 'constrained' / 'unconstrained' / 'both'；both 时两种模式共用同一次数据加载
+    """
+    modes = MODES if mode == 'both' else (mode,)
     dataset_dir = './datasets/one_year'
     output_dir = './results'
     os.makedirs(output_dir, exist_ok=True)
@@ -32,51 +93,47 @@ def main():
     }
 
     # 提取 Top-3 即可，给模型 3 个专家视角
-    extractor = MODWTPeriodExtractor(wavelet_name='db4', top_k=3)
+    # 已按数据集多进程并行，每个进程内 FFT 只用单线程，避免线程数超过 CPU 核数
+    extractor_state = {'wavelet_name': 'db4', 'top_k': 3, 'fft_workers': 1}
 
-    final_periods_dict = {}
+    final_periods_dict = {m: {} for m in modes}
 
     print("=" * 60)
     print("Start Wavelet-based Local Periodicity Extraction")
     print("Strategy: Masking global trends during extraction")
     print("=" * 60)
 
-    for ds_name, config in datasets_config.items():
-        file_path = os.path.join(dataset_dir, ds_name)
-        if not os.path.exists(file_path):
-            continue
-            
-        print(f"\nProcessing {ds_name}...")
-        
-        # 1. 加载数据
-        series = load_data(file_path, scale=True)
-        if series is None: continue
-            
-        # 2. 提取周期 (传入约束参数)
-        max_p = config['max_p']
-        results = extractor.extract(series, input_name=ds_name, max_allowed_period=max_p)
-        
-        # 3. 获取结果
-        top_k_periods = [p for p, e in results['top_k']]
-        
-        # 4. 兜底策略：如果提取出来的全是 2, 4 这种极小噪声
-        # 或者不足 3 个，我们可以手动补全一些更有意义的
-        # 但通常经过上述修改，应该能提取到 16, 32, 64 等中频信号
-        
-        final_periods_dict[ds_name] = top_k_periods
-        
-        # 绘图
-        plot_name = ds_name.replace('.csv', '_spectrum.png')
-        extractor.plot_spectrum(results, save_path=os.path.join(output_dir, plot_name))
+    tasks = {ds_name: config for ds_name, config in datasets_config.items()
+             if os.path.exists(os.path.join(dataset_dir, ds_name))}
 
-    print("\n" + "=" * 60)
-    print("Final Periods Configuration for ADF-Net:")
-    print("=" * 60)
-    print("periods_map = {")
-    for name, periods in final_periods_dict.items():
-        # 格式化输出，方便直接复制到论文代码
-        print(f"    '{name.split('.')[0]}': {periods},")
-    print("}")
+    # 各数据集互不依赖，多进程并行处理
+    if tasks:
+        max_workers = min(len(tasks), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_worker_init,
+                                 initargs=(extractor_state,)) as ex:
+            futures = [ex.submit(_process, ds_name, config, modes, dataset_dir, output_dir)
+                       for ds_name, config in tasks.items()]
+            for f in as_completed(futures):
+                ds_name, periods_by_mode = f.result()
+                if periods_by_mode is not None:
+                    for m, top_k_periods in periods_by_mode.items():
+                        final_periods_dict[m][ds_name] = top_k_periods
+
+    for m in modes:
+        print("\n" + "=" * 60)
+        print(f"Final Periods Configuration for ADF-Net ({m}):")
+        print("=" * 60)
+        print("periods_map = {")
+        # 按配置顺序输出，而不是按完成顺序
+        for name in tasks:
+            if name in final_periods_dict[m]:
+                # 格式化输出，方便直接复制到论文代码
+                print(f"    '{name.split('.')[0]}': {final_periods_dict[m][name]},")
+        print("}")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Wavelet-based local periodicity extraction')
+    parser.add_argument('--mode', choices=MODES + ('both',), default='constrained',
+                        help="constrained: 周期不超过 max_p；unconstrained: 不加约束；both: 两者都跑")
+    args = parser.parse_args()
+    main(args.mode)
\ No newline at end of file
@@ -1,22 +1,42 @@
 '''
-为了实现 MODWT（不降采样），我们使用 pywt.swt (Stationary Wavelet Transform)，它在数学上等价于 MODWT。
+为了实现 MODWT（不降采样），我们按 pywt.swt (Stationary Wavelet Transform) 的 à trous 算法计算，它在数学上等价于 MODWT。
+这里用 scipy.fft 在频域完成各层的循环卷积，比 pywt.swt 的时域卷积快得多。
 '''
 import numpy as np
 import pywt
+import scipy.fft
 import matplotlib.pyplot as plt
 import os
+import functools
+
+@functools.lru_cache(maxsize=1)
+def _wavelist():
+    """PyWavelets 支持的全部小波名称，只枚举一次"""
+    return frozenset(pywt.wavelist())
 
 class MODWTPeriodExtractor:
-    def __init__(self, wavelet_name='db4', top_k=3):
+    def __init__(self, wavelet_name='db4', top_k=3, fft_workers=-1):
         """
         初始化 MODWT 周期提取器
         :param wavelet_name: 母小波名称，论文中选用 'db4'
         :param top_k: 提取前 k 个主导周期
+        :param fft_workers: 批量 irfft 使用的线程数 (scipy.fft 的 workers)，-1 为全部 CPU 核；
+                            在多进程中运行时应设为 1，避免线程数超过 CPU 核数
         """
         self.wavelet_name = wavelet_name
         self.top_k = top_k
+        self.fft_workers = fft_workers
         # 验证小波名称
-        assert wavelet_name in pywt.wavelist(), f"Wavelet {wavelet_name} not found in PyWavelets."
+        assert wavelet_name in _wavelist(), f"Wavelet {wavelet_name} not found in PyWavelets."
+        # 分解滤波器只取一次，避免每次 extract 都重建 Wavelet 对象
+        wavelet = pywt.Wavelet(wavelet_name)
+        self._g = np.asarray(wavelet.dec_lo)
+        self._h = np.asarray(wavelet.dec_hi)
+        # (序列长度 N, 分解层数 J) -> 前 J 层细节系数等效滤波器频谱堆成的 (J, N//2+1) 矩阵 (complex64)
+        self._filter_cache = {}
+        # plot_spectrum 复用的画布，首次绘图时才创建
+        self._fig = None
+        self._ax = None
 
     def _pad_sequence(self, data, max_level):
         """
@@ -25,12 +45,79 @@ class MODWTPeriodExtractor:
         """
         n = len(data)
         target_len = int(np.ceil(n / (2**max_level))) * (2**max_level)
-        if target_len > n:
-            pad_width = target_len - n
-            # 使用 'reflect' 模式填充，保持边界连续性
-            data = np.pad(data, (0, pad_width), 'reflect')
+        if target_len == n:
+            # 已对齐时原样返回，不复制；extract 随后可走 Parseval 快速路径
+            return data, n
+        pad_width = target_len - n
+        # 使用 'reflect' 模式填充，保持边界连续性
+        data = np.pad(data, (0, pad_width), 'reflect')
         return data, n  # 返回填充后的数据和原始长度
 
+    def _upsample_filter(self, filt, level, n):
+        """
+        构造第 level 层的 à trous 滤波器：相邻抽头之间插入 2^(level-1)-1 个零，
+        并以长度 n 循环放置。抽头按滤波器中心对齐，使结果与 pywt.swt 的系数一一对应。
+        """
+        stride = 2 ** (level - 1)
+        f = np.zeros(n, dtype=np.float32)
+        taps = (np.arange(len(filt)) - len(filt) // 2) * stride % n
+        np.add.at(f, taps, filt)
+        return f
+
+    # _filter_cache 最多保留的序列长度组合数，超出时丢弃最早加入的
+    _FILTER_CACHE_SIZE = 8
+
+    def _get_detail_filters(self, n, levels):
+        """
+        返回长度 n 下前 levels 层细节系数等效滤波器的频谱，形状 (levels, n//2+1)。
+        第 j 行为 H_j 乘以前 j-1 层上采样低通的乘积，cD_j 只需信号频谱乘一次即可得到，不必逐层级联。
+        同一长度的序列 (如各 ETTh 数据集) 会直接复用缓存的整块矩阵。
+        """
+        key = (n, levels)
+        if key not in self._filter_cache:
+            H_eq = np.empty((levels, n // 2 + 1), dtype=np.complex64)
+            G_cum = None  # 前 j-1 层上采样低通的累积乘积
+            for j in range(1, levels + 1):
+                G = scipy.fft.rfft(self._upsample_filter(self._g, j, n))
+                H = scipy.fft.rfft(self._upsample_filter(self._h, j, n))
+                H_eq[j - 1] = H if G_cum is None else G_cum * H
+                G_cum = G if G_cum is None else G_cum * G
+            if len(self._filter_cache) >= self._FILTER_CACHE_SIZE:
+                del self._filter_cache[next(iter(self._filter_cache))]
+            self._filter_cache[key] = H_eq
+        return self._filter_cache[key]
+
+    def _spectrum_variance(self, Y, n):
+        """
+        由长度为 n 的实序列的 rfft 频谱 Y 计算其方差 (Parseval 定理)。
+        rfft 只保留了一半频点，除 DC 与 (n 为偶数时的) Nyquist 频点外都要计两次。
+        Y 可以是 (J, n//2+1) 的矩阵，此时沿最后一维对每一行分别计算。
+        """
+        power = np.abs(Y) ** 2
+        total = 2 * power.sum(axis=-1) - power[..., 0]
+        if n % 2 == 0:
+            total -= power[..., -1]
+        mean = Y[..., 0].real / n
+        return total / n ** 2 - mean ** 2
+
+    def _select_top_k(self, periods, energies):
+        """
+        按能量从大到小返回前 top_k 个 (period, energy)。
+        k 远小于层数时 (如 top_k=3, J=12) 做 k 次 argmax；否则 argpartition 后只对 k 个排序。
+        """
+        k = min(self.top_k, len(energies))
+        if 2 * k <= len(energies):
+            e = np.array(energies, dtype=np.float64)
+            top_idx = []
+            for _ in range(k):
+                idx = int(np.argmax(e))
+                top_idx.append(idx)
+                e[idx] = -np.inf
+        else:
+            top_idx = np.argpartition(energies, -k)[-k:] if k > 0 else np.arange(0)
+            top_idx = top_idx[np.argsort(-energies[top_idx], kind='stable')]
+        return list(zip(periods[top_idx].tolist(), energies[top_idx].tolist()))
+
     def extract(self, data_series, input_name="Series", max_allowed_period=None):
             """
             执行 MODWT 并提取主导周期
@@ -45,34 +132,44 @@ class MODWTPeriodExtractor:
             # 但也不要太深，通常 12 层足够覆盖 4096 (15分钟数据的月周期)
             decompose_level = min(12, max_level)
 
+            # 周期排序不需要 float64 精度，全程 float32/complex64 以减半内存带宽
+            data_series = np.asarray(data_series, dtype=np.float32)
+
             # 序列补齐
             padded_data, original_len = self._pad_sequence(data_series, decompose_level)
 
-            # MODWT 分解
-            coeffs = pywt.swt(padded_data, self.wavelet_name, level=decompose_level)
-            
-            candidates = [] # 存储 (period, energy)
+            # MODWT 分解：在频域做 à trous 循环卷积，信号的 FFT 只算一次，各层复用
+            N = len(padded_data)
+            X = scipy.fft.rfft(padded_data)
             
-            # 遍历每一层
-            for j in range(1, decompose_level + 1):
-                period = 2 ** j
-                
-                # 【核心修改】：如果在计算能量前发现周期已经超标，直接跳过
-                # 这样趋势项的能量再大，也不会进入 candidates 列表
-                if max_allowed_period is not None and period > max_allowed_period:
-                    continue
-
-                # 获取细节系数 cD
-                cD_j = coeffs[-j][1] 
-                cD_j = cD_j[:original_len]
-                energy = np.var(cD_j)
-                
-                candidates.append((period, energy))
+            periods = 2 ** np.arange(1, decompose_level + 1)
+            # 【核心修改】：如果在计算能量前发现周期已经超标，直接跳过
+            # 这样趋势项的能量再大，也不会进入 candidates 列表
+            # 周期随层数单调递增，超标的层都在末尾，连频谱乘法都不必再做
+            if max_allowed_period is not None:
+                periods = periods[periods <= max_allowed_period]
+
+            # 各层细节系数 cD_j 的频谱 = 信号频谱 × 第 j 层等效滤波器，堆成 (J, N//2+1) 矩阵
+            # 不再逐层级联计算近似系数；缓存按全部 decompose_level 层存，合规的层取前几行 (视图，不复制)
+            H_eq = self._get_detail_filters(N, decompose_level)[:len(periods)]
+            D = X * H_eq
+
+            # 所有层的方差一次性批量计算
+            if N == original_len:
+                # 未填充时，方差直接由频谱按 Parseval 定理得到，无需 irfft
+                energies = self._spectrum_variance(D, N)
+            else:
+                # 有填充时只统计原始长度内的系数，需回到时域截断
+                # pocketfft 的 workers 只把相互独立的一维变换分给多个线程，
+                # 因此只有这里按层批量的 irfft 能用上多线程
+                cD = scipy.fft.irfft(D, n=N, axis=-1, workers=self.fft_workers)
+                energies = cD[:, :original_len].var(axis=1)
+
+            candidates = list(zip(periods.tolist(), energies.tolist())) # 存储 (period, energy)
                 
             # Top-k 筛选
-            # 现在 candidates 里全是合规的周期，按能量排序即可
-            sorted_candidates = sorted(candidates, key=lambda x: x[1], reverse=True)
-            top_k_periods = sorted_candidates[:self.top_k]
+            # 现在 candidates 里全是合规的周期，取能量最大的 k 个即可
+            top_k_periods = self._select_top_k(periods, energies)
             
             # 提取用于绘图的全谱数据 (为了画图好看，我们还是把所有的存下来，但在 top_k 里不显示)
             all_periods = [2**j for j in range(1, decompose_level+1)]
@@ -93,27 +190,42 @@ class MODWTPeriodExtractor:
     def plot_spectrum(self, results, save_path=None):
         """
         可视化：绘制小波能量谱
+        画布在多次调用间复用，不会自动关闭；用完后调用 close() 释放
         """
         periods = results['all_periods']
         energies = results['all_energies']
         top_k = [p for p, e in results['top_k']]
 
-        plt.figure(figsize=(10, 6))
-        bars = plt.bar(range(len(periods)), energies, color='skyblue', edgecolor='navy')
-        
-        # 高亮 Top-k
-        sorted_indices = np.argsort(energies)[::-1][:self.top_k]
-        for idx in sorted_indices:
-            bars[idx].set_color('orange')
-            bars[idx].set_edgecolor('red')
-
-        plt.xticks(range(len(periods)), [str(p) for p in periods])
-        plt.xlabel('Period Length ($2^j$)')
-        plt.ylabel('Wavelet Variance (Energy)')
-        plt.title(f'Wavelet Energy Spectrum (Top Periods: {top_k})')
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
+        # 高亮 Top-k：直接用 extract 选出的周期，保证与打印/返回的结果一致
+        # 预先生成颜色数组，一次性传给 bar，不再逐个修改柱子
+        colors = np.full(len(periods), 'skyblue', dtype=object)
+        edges = np.full(len(periods), 'navy', dtype=object)
+        top_idx = [periods.index(p) for p in top_k]
+        colors[top_idx] = 'orange'
+        edges[top_idx] = 'red'
+
+        # 所有数据集共用一张画布，每次只清空坐标轴重画
+        if self._fig is None:
+            self._fig, self._ax = plt.subplots(figsize=(10, 6))
+        ax = self._ax
+        ax.clear()
+        ax.bar(range(len(periods)), energies, color=colors, edgecolor=edges)
+
+        ax.set_xticks(range(len(periods)), [str(p) for p in periods])
+        ax.set_xlabel('Period Length ($2^j$)')
+        ax.set_ylabel('Wavelet Variance (Energy)')
+        ax.set_title(f'Wavelet Energy Spectrum (Top Periods: {top_k})')
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
         
         if save_path:
-            plt.savefig(save_path, dpi=300)
+            self._fig.savefig(save_path, dpi=300)
             print(f"Plot saved to {save_path}")
-        plt.close()
\ No newline at end of file
+
+    def close(self):
+        """
+        释放 plot_spectrum 复用的画布
+        """
+        if self._fig is not None:
+            plt.close(self._fig)
+            self._fig = None
+            self._ax = None
\ No newline at end of file